@@ -12,6 +12,7 @@ setup(
     entry_points = {
         'console_scripts': [
             'compile = opendesk_on_demand.main:main',
+            'publish = opendesk_on_demand.publish:main',
         ],
     },
 )
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+
+"""Compare two compiles of the same model and describe the difference as
+  a compact delta, so that clients and caches holding the previous
+  ``obj.json`` and ``config.json`` can patch them rather than refetching:
+
+      {
+        "from": "<previous version id>",
+        "to": "<new version id>",
+        "meta": {...},
+        "config": {
+          "set": {"key": value, ...},
+          "unset": ["key", ...]
+        },
+        "data": {
+          "ranges": [[start, [item, ...]], ...],
+          "transformations": [[index, {...} or null], ...],
+          "length": 21002
+        }
+      }
+
+  The ``ranges`` replace runs of items whose geometry (or pass through
+  line) changed, with any ``transformations`` stripped. The
+  ``transformations`` then set (or, when ``null``, remove) the
+  transformation entries of individual items.
+
+  Deltas are written without whitespace, next to the ``obj.json`` of the
+  compile they patch into, as ``delta-$from-$to.json``. Only the last
+  :data:`MAX_DELTAS` are kept.
+"""
+
+import copy
+import glob
+import hashlib
+import io
+import itertools
+import json
+import os
+import os.path
+import re
+import shutil
+import tempfile
+
+from . import log
+
+DELTA_NAME = 'delta-{0}-{1}.json'
+DELTA_PATTERN = re.compile(r'^delta-(\w+)-(\w+)\.json$')
+MAX_DELTAS = 10
+SEPARATORS = (',', ':')
+
+DATA_START = u'  "data": ['
+META_START = u'  "meta": '
+ITEM_START = u'    {'
+ITEM_ENDS = (
+    u'    }',
+    u'    },',
+)
+
+def dumps(value):
+    return json.dumps(value, separators=SEPARATORS)
+
+def parse_name(filename):
+    """Return the ``(from, to)`` version ids of a delta file, or None."""
+
+    match = DELTA_PATTERN.match(filename)
+    if match is None:
+        return None
+    return match.groups()
+
+def version_id(obj_data, config_data):
+    """Hash the content of a compile, ignoring any existing version id.
+      Hashes the items one at a time, as the data may be disk backed.
+    """
+
+    meta = dict(obj_data.get('meta', {}))
+    meta.pop('version_id', None)
+    digest = hashlib.sha1()
+    for data in (meta, config_data):
+        digest.update(json.dumps(data, sort_keys=True).encode('utf-8'))
+    for item in obj_data['data']:
+        digest.update(json.dumps(item, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+def read_meta(f):
+    """Read the ``meta`` of an ``obj.json`` without parsing its data."""
+
+    for line in f:
+        if not line.startswith(META_START):
+            continue
+        text = line[len(META_START):]
+        for line in itertools.chain([u''], f):
+            text += line
+            try:
+                return json.loads(text.rstrip().rstrip(u','))
+            except ValueError:
+                continue
+    return {}
+
+def gen_file_items(f):
+    """Yield the items of an ``obj.json`` one at a time, relying on the
+      layout that :func:`main.write_obj_json` writes them in.
+    """
+
+    for line in f:
+        if line.rstrip(u'\n') == DATA_START:
+            break
+    else:
+        return
+    item_lines = []
+    for line in f:
+        stripped = line.rstrip(u'\n')
+        if not item_lines and stripped != ITEM_START:
+            return
+        item_lines.append(line)
+        if stripped in ITEM_ENDS:
+            yield json.loads(u''.join(item_lines).rstrip().rstrip(u','))
+            item_lines = []
+
+def split_item(item):
+    """Split an item into its base and its transformations."""
+
+    base = {k: v for k, v in item.items() if k != 'transformations'}
+    return base, item.get('transformations')
+
+def diff_config(old_config, new_config):
+    return {
+        'set': {
+            k: v for k, v in new_config.items()
+            if k not in old_config or old_config[k] != v
+        },
+        'unset': sorted(k for k in old_config if k not in new_config),
+    }
+
+def write_delta(f, from_id, old_items, old_config_data, obj_data,
+        config_data):
+    """Write the delta that patches the old compile into the new one to
+      ``f``, reading the items of both one at a time. The transformations
+      are buffered in a temporary file, as they follow the ranges.
+    """
+
+    header = {
+        'from': from_id,
+        'to': obj_data['meta'].get('version_id') or
+                version_id(obj_data, config_data),
+        'meta': obj_data['meta'],
+        'config': diff_config(old_config_data, config_data),
+    }
+    f.write(dumps(header)[:-1])
+    f.write(u',"data":{"ranges":[')
+    length = num_ranges = num_transformations = 0
+    current = None
+    with tempfile.TemporaryFile('w+') as transformations_file:
+        pairs = itertools.zip_longest(old_items, obj_data['data'])
+        for i, (old_item, new_item) in enumerate(pairs):
+            if new_item is None:
+                break
+            length += 1
+            new_base, new_transformations = split_item(new_item)
+            if old_item is None:
+                old_base, old_transformations = None, None
+            else:
+                old_base, old_transformations = split_item(old_item)
+            if new_base != old_base:
+                if current is None:
+                    if num_ranges:
+                        f.write(u',')
+                    f.write(u'[{0},['.format(i))
+                    num_ranges += 1
+                    current = i
+                else:
+                    f.write(u',')
+                f.write(dumps(new_base))
+                old_transformations = None
+            elif current is not None:
+                f.write(u']]')
+                current = None
+            if new_transformations != old_transformations:
+                if num_transformations:
+                    transformations_file.write(u',')
+                transformations_file.write(dumps([i, new_transformations]))
+                num_transformations += 1
+        if current is not None:
+            f.write(u']]')
+        f.write(u'],"transformations":[')
+        transformations_file.seek(0)
+        shutil.copyfileobj(transformations_file, f)
+    f.write(u'],"length":{0}}}}}'.format(length))
+
+def diff(old_obj_data, old_config_data, new_obj_data, new_config_data):
+    """Return the delta that patches the old compile into the new one."""
+
+    from_id = old_obj_data['meta'].get('version_id') or \
+            version_id(old_obj_data, old_config_data)
+    f = io.StringIO()
+    write_delta(f, from_id, old_obj_data['data'], old_config_data,
+            new_obj_data, new_config_data)
+    return json.loads(f.getvalue())
+
+def patch(obj_data, config_data, delta):
+    """Apply a ``delta`` to the old compile, returning the new one."""
+
+    items = copy.deepcopy(obj_data['data'][:delta['data']['length']])
+    for start, bases in delta['data']['ranges']:
+        for i, base in enumerate(bases, start):
+            if i < len(items):
+                items[i] = copy.deepcopy(base)
+            else:
+                items.append(copy.deepcopy(base))
+    for i, transformations in delta['data']['transformations']:
+        item = items[i]
+        if transformations is None:
+            item.pop('transformations', None)
+        else:
+            item['transformations'] = copy.deepcopy(transformations)
+    new_obj_data = {
+        'data': items,
+        'meta': copy.deepcopy(delta['meta']),
+    }
+    new_config_data = copy.deepcopy(config_data)
+    for key in delta['config']['unset']:
+        new_config_data.pop(key, None)
+    new_config_data.update(copy.deepcopy(delta['config']['set']))
+    return new_obj_data, new_config_data
+
+def write_delta_file(model_dir, obj_data, config_data):
+    """Write the delta from the compile in the ``model_dir`` to this one,
+      streaming the old ``obj.json`` rather than loading it, then prune
+      the older deltas. Returns the path to the delta, if written.
+    """
+
+    obj_filepath = os.path.join(model_dir, 'obj.json')
+    config_filepath = os.path.join(model_dir, 'config.json')
+    if not (os.path.exists(obj_filepath) and os.path.exists(config_filepath)):
+        return None
+    with open(obj_filepath, 'r') as f:
+        from_id = read_meta(f).get('version_id')
+    to_id = obj_data['meta']['version_id']
+    if from_id is None:
+        log.info(u'No version id in `{0}`.'.format(obj_filepath))
+        return None
+    if from_id == to_id:
+        return None
+    with open(config_filepath, 'r') as f:
+        old_config_data = json.loads(f.read())
+    filename = DELTA_NAME.format(from_id, to_id)
+    filepath = os.path.join(model_dir, filename)
+    tmp_filepath = '{0}.tmp'.format(filepath)
+    with open(obj_filepath, 'r') as old_f:
+        with open(tmp_filepath, 'w') as f:
+            write_delta(f, from_id, gen_file_items(old_f), old_config_data,
+                    obj_data, config_data)
+    os.rename(tmp_filepath, filepath)
+    prune(model_dir, filename)
+    return filepath
+
+def prune(model_dir, filename):
+    """Remove the deltas superseded by ``filename``, i.e.: from the same
+      version, and all but the newest :data:`MAX_DELTAS`.
+    """
+
+    from_id = parse_name(filename)[0]
+    filepaths = []
+    for filepath in glob.glob(os.path.join(model_dir, 'delta-*.json')):
+        name = os.path.basename(filepath)
+        ids = parse_name(name)
+        if ids is None:
+            continue
+        if ids[0] == from_id and name != filename:
+            os.remove(filepath)
+            continue
+        filepaths.append(filepath)
+    filepaths.sort(key=os.path.getmtime, reverse=True)
+    for filepath in filepaths[MAX_DELTAS:]:
+        os.remove(filepath)
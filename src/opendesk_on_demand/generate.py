@@ -26,19 +26,32 @@
   - `height.stl`
   - `config.json`
 
+  If the geometry doesn't move linearly with the parameter, it can list
+  several `comparison_values` instead of one `comparison_value`, with a
+  `$param.$n.stl` per value, e.g.: `height.0.stl`, `height.1.stl`, etc.
+
   Then generate an ``obj.json`` AST / nodelist with transformation functions
   mixed into the nodes and return along with the ``config.json``.
 """
 
 import argparse
+import bisect
 import collections
 import copy
 import fnmatch
+import io
+import itertools
 import json
+import multiprocessing
 import os.path
 import re
+import warnings
+import zlib
+
+from json.encoder import encode_basestring_ascii
 
 from . import log
+from . import spill
 
 AXIS = (
     u'x',
@@ -65,8 +78,25 @@ UNIT_CONVERSIONS = (
     ('in', 'cm', 2.54),
     ('in', 'mm', 25.4),
 )
+BOUNDARY_BLOCK = 64 * 1024
+CHUNKS_PER_PROCESS = 4
+OUTPUT_EXPANSION = 5
+SERIAL_CHUNK_SIZE = 1024
+FIT_TOLERANCE = 1e-5
+NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?', re.U)
+STRUCTURE_CACHE_SIZE = 4096
+PREFLIGHT_MODES = (
+    u'strict',
+    u'warn',
+    u'off',
+)
 VERSION = '0.0.1'
 
+INFINITY = float('inf')
+ITEM_PREFIX = u'\n    '
+ITEM_SEPARATOR = u',' + ITEM_PREFIX
+WORKER = {}
+
 def convert_units(value, from_units, to_units):
     """Generic unit conversion between cm, mm and inches."""
 
@@ -79,21 +109,346 @@ def convert_units(value, from_units, to_units):
             return value * item[2]
     raise NotImplementedError('Units not yet supported')
 
+def get_samples(key, config_item):
+    """Return a ``(name, comparison_value)`` for each export of the
+      parameter, where the ``name`` is the parameter file's name without
+      its extension.
+    """
+
+    values = config_item.get('comparison_values')
+    if values is None:
+        return [(key, config_item.get('comparison_value'))]
+    return [(u'{0}.{1}'.format(key, i), v) for i, v in enumerate(values)]
+
+Fingerprint = collections.namedtuple('Fingerprint',
+        ['lines', 'vertices', 'digest'])
+Tally = collections.namedtuple('Tally',
+        ['lines', 'vertices', 'total', 'weighted'])
+
+class MisalignedError(ValueError):
+    """Raised when a parameter file doesn't line up with the source file."""
+
+class MisalignedWarning(UserWarning):
+    """Warned, in ``warn`` preflight mode, when a parameter file doesn't
+      line up with the source file and so is ignored.
+    """
+
+def get_fingerprint(tallies):
+    """Combine the :data:`Tally` of each consecutive range of a file into
+      the :data:`Fingerprint` of the whole file. The digest weights the
+      checksum of each line's structure by its position, so it's the same
+      however the file was split.
+    """
+
+    num_lines = vertices = digest = 0
+    for tally in tallies:
+        digest += tally.weighted + (num_lines + 1) * tally.total
+        num_lines += tally.lines
+        vertices += tally.vertices
+    return Fingerprint(num_lines, vertices, u'{0:016x}'.format(digest % 2**64))
+
+def get_position(number):
+    if number is None:
+        return u'the end'
+    return u'line {0}'.format(number)
+
+def gen_numbered_lines(obj_file):
+    """Like :meth:`Parser.gen_lines` but yields ``(number, line)`` pairs,
+      where the ``number`` is the line of the file that the line starts on.
+    """
+
+    pending = None
+    pending_number = None
+    for number, line in enumerate(obj_file, 1):
+        tail = line
+        if pending is not None:
+            if line.startswith(u' '):
+                tail = line[1:]
+                line = pending[:-2] + tail
+                number = pending_number
+            else:
+                pending = pending.strip()
+                if pending:
+                    yield pending_number, pending
+            pending = None
+        if tail.endswith(u'\\\n'):
+            pending = line
+            pending_number = number
+            continue
+        line = line.strip()
+        if line:
+            yield number, line
+    if pending is not None:
+        pending = pending.strip()
+        if pending:
+            yield pending_number, pending
+
+def dump_json(value, prefix=u'\n'):
+    """Like ``json.dumps(value, indent=2)``, with every line after the first
+      indented by ``prefix``, but a good deal faster for our items, as the
+      indenting encoder in the standard library is pure Python.
+    """
+
+    type_ = type(value)
+    if type_ is float:
+        if value != value:
+            return u'NaN'
+        if value == INFINITY:
+            return u'Infinity'
+        if value == -INFINITY:
+            return u'-Infinity'
+        return float.__repr__(value)
+    if type_ is str:
+        return encode_basestring_ascii(value)
+    inner = prefix + u'  '
+    if isinstance(value, dict):
+        if not value:
+            return u'{}'
+        parts = [
+            encode_basestring_ascii(k) + u': ' + dump_json(v, inner)
+            for k, v in value.items()
+        ]
+        return u'{' + inner + (u',' + inner).join(parts) + prefix + u'}'
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return u'[]'
+        parts = [dump_json(v, inner) for v in value]
+        return u'[' + inner + (u',' + inner).join(parts) + prefix + u']'
+    if value is None:
+        return u'null'
+    if value is True:
+        return u'true'
+    if value is False:
+        return u'false'
+    if isinstance(value, int):
+        return int.__repr__(value)
+    if isinstance(value, float):
+        return dump_json(float(value), prefix)
+    return json.dumps(value, indent=2).replace(u'\n', prefix)
+
+def find_boundary(f, offset):
+    """Return the offset of the first line boundary after ``offset`` in the
+      binary file ``f`` that doesn't fall within a backslash continuation,
+      i.e.: where the line before doesn't end with a backslash or the line
+      after doesn't start with a space. See :meth:`Parser.gen_lines`.
+    """
+
+    if offset <= 0:
+        return 0
+    start = max(0, offset - 2)
+    f.seek(start)
+    data = f.read(BOUNDARY_BLOCK)
+    i = offset - start
+    while True:
+        n = data.find(b'\n', i)
+        if n == -1 or n + 1 == len(data):
+            more = f.read(BOUNDARY_BLOCK)
+            if not more:
+                return start + len(data)
+            data += more
+            continue
+        before = data[n - 1:n]
+        if before == b'\r':
+            before = data[n - 2:n - 1]
+        if before != b'\\' or data[n + 1:n + 2] != b' ':
+            return start + n + 1
+        i = n + 1
+
+def gen_ranges(filepath, count):
+    """Split the file into (up to) ``count`` ``(start, stop)`` byte ranges
+      at safe line boundaries.
+    """
+
+    size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as f:
+        offsets = [find_boundary(f, size * k // count) for k in range(count)]
+    offsets = sorted(set(offsets + [size]))
+    return list(zip(offsets[:-1], offsets[1:]))
+
+def open_range(f, start):
+    """Open the binary file ``f`` as text from byte offset ``start``."""
+
+    f.seek(start)
+    return io.TextIOWrapper(f, encoding='latin-1', newline=None)
+
+def init_worker(config, file_format, model_units, geometry_units, preflight):
+    """Set up a worker process with the :class:`Parser` for its chunks."""
+
+    WORKER['parser'] = Parser(config, None, {}, file_format, model_units,
+            geometry_units)
+    WORKER['structure'] = Structure(file_format) if preflight else None
+
+def scan_range(job):
+    """Tally the lines in a byte range of a file, in a worker process.
+      Without a preflight we only count them.
+    """
+
+    filepath, start, stop = job
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        data = f.read(stop - start)
+    stream = io.TextIOWrapper(io.BytesIO(data), encoding='latin-1',
+            newline=None)
+    lines = Parser.gen_lines(stream)
+    structure = WORKER['structure']
+    if structure is None:
+        return Tally(sum(1 for _ in lines), 0, 0, 0)
+    return structure.scan(lines)
+
+def read_slice(filepath, start, skip, count):
+    """Read ``count`` lines from the file, after skipping ``skip`` lines
+      from byte offset ``start``. Reads to the end if ``count`` is None.
+    """
+
+    with open(filepath, 'rb') as f:
+        stream = open_range(f, start)
+        stop = None if count is None else skip + count
+        return list(itertools.islice(Parser.gen_lines(stream), skip, stop))
+
+def serialise_items(items):
+    """Return the JSON text that the items are written to ``obj.json`` as."""
+
+    return ITEM_SEPARATOR.join(dump_json(x, ITEM_PREFIX) for x in items)
+
+def parse_chunk(job):
+    """Parse and transform one chunk of the source in a worker process.
+
+      Each worker reads its own slice of the source and of each parameter
+      file, covering the same item indexes, so that the ``alt_lines``
+      line up. The items go back as the JSON text that they'll be written
+      to ``obj.json`` as, which is much cheaper to send between processes
+      than the items themselves.
+    """
+
+    source_slice, param_slices = job
+    parser = WORKER['parser']
+    lines = read_slice(*source_slice)
+    parser.params = {k: read_slice(*v) for k, v in param_slices.items()}
+    items = parser.transform(parser.parse(lines))
+    return len(lines), serialise_items(items)
+
+class Structure(object):
+    """Reduce lines to the part of them that shouldn't change between
+      exports, to fingerprint and compare files. Geometry records become
+      their type, e.g.: `vertex`; other lines have their numbers masked,
+      prefixed with a space so they can never collide with a geometry type.
+
+      Tokens are cached, with their checksum, by first word for geometry
+      records and by line for the rest, which mostly repeat.
+    """
+
+    def __init__(self, file_format):
+        self.match_expressions = file_format['match'].items()
+        self.words = {}
+        self.lines = {}
+
+    def get_token(self, line):
+        """Returns a ``(token, checksum, is_geometry)`` tuple for the line."""
+
+        if line is None:
+            return None
+        word, space, _ = line.partition(u' ')
+        if space:
+            token = self.words.get(word)
+            if token is None:
+                token = self.get_geometry_token(word)
+                self.cache(self.words, word, token)
+            if token:
+                return token
+        token = self.lines.get(line)
+        if token is None:
+            masked = u' ' + NUMBER.sub(u'#', line)
+            token = (masked, zlib.crc32(masked.encode('utf-8')), 0)
+            self.cache(self.lines, line, token)
+        return token
+
+    def get_geometry_token(self, word):
+        for type_, expr in self.match_expressions:
+            if expr.match(word + u' '):
+                return (type_, zlib.crc32(type_.encode('utf-8')), 1)
+        return False
+
+    def cache(self, tokens, key, token):
+        if len(tokens) >= STRUCTURE_CACHE_SIZE:
+            tokens.clear()
+        tokens[key] = token
+
+    def scan(self, lines, store=None):
+        """Tally up the lines, appending them to the ``store`` if given."""
+
+        num_lines = vertices = total = weighted = 0
+        get_token = self.get_token
+        for line in lines:
+            _, checksum, is_geometry = get_token(line)
+            vertices += is_geometry
+            total += checksum
+            weighted += num_lines * checksum
+            num_lines += 1
+            if store is not None:
+                store.append(line)
+        return Tally(num_lines, vertices, total, weighted)
+
+class SerialisedItems(object):
+    """The items parsed by the worker processes, or within a budget, kept
+      as the JSON text that they'll be written to ``obj.json`` as, one
+      chunk of items at a time.
+    """
+
+    def __init__(self, budget=None):
+        self.chunks = spill.create(budget)
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            for item in json.loads(u'[' + chunk + u']'):
+                yield item
+
+    def append_chunk(self, text, count):
+        if count:
+            self.chunks.append(text)
+            self.length += count
+
+    def gen_json(self):
+        """Yield the chunks of JSON text, in order."""
+
+        return iter(self.chunks)
+
+    def close(self):
+        spill.close(self.chunks)
+
 class Generator(object):
     """Parse all the data from the target dir. Call the parser.
       Coerce the return value.
     """
 
-    def __init__(self, target_dir, model_units, geometry_units, extension=None):
+    def __init__(self, target_dir, model_units, geometry_units, extension=None,
+            processes=None, preflight=u'strict', max_memory=None):
+        if preflight not in PREFLIGHT_MODES:
+            msg = u'Preflight mode must be one of `{0}`.'
+            raise ValueError(msg.format(PREFLIGHT_MODES))
+        if processes is not None and processes < 1:
+            raise ValueError(u'The number of processes must be at least 1.')
+        if max_memory is not None and max_memory < 1:
+            raise ValueError(u'The memory budget must be at least 1 byte.')
         self.target_dir = target_dir
         self.model_units = model_units
         self.geometry_units = geometry_units
+        self.processes = processes
+        self.preflight_mode = preflight
+        self.fingerprints = {}
+        self.max_memory = max_memory
+        self.budget = None
         self.extension = self.determine_extension(extension)
         self.file_format = FILE_FORMATS[self.extension]
 
     def __call__(self):
         param_files = {}
         target_dir = self.target_dir
+        if self.max_memory is not None:
+            self.budget = spill.Budget(self.max_memory)
         try:
             config_name = 'config.json'
             source_name = 'source.{0}'.format(self.extension)
@@ -102,17 +457,25 @@ class Generator(object):
             with open(config_filepath, 'r') as config_file:
                 config_data = json.loads(config_file.read())
             with open(source_filepath, 'r', encoding='latin-1') as source_file:
-                for key in config_data['parameters']:
-                    filename = '{0}.{1}'.format(key, self.extension)
-                    param_filepath = os.path.join(target_dir, filename)
-                    if not os.path.exists(param_filepath):
-                        continue
-                    param_files[key] = open(param_filepath, 'r', encoding='latin-1')
-                parser = Parser(config_data, source_file, param_files,
-                        self.file_format, self.model_units, self.geometry_units)
-                gen_items = parser()
+                for key, c in config_data['parameters'].items():
+                    for name, _ in get_samples(key, c):
+                        filename = '{0}.{1}'.format(name, self.extension)
+                        param_filepath = os.path.join(target_dir, filename)
+                        if not os.path.exists(param_filepath):
+                            continue
+                        param_files[name] = open(param_filepath, 'r',
+                                encoding='latin-1')
+                if self.processes and self.processes > 1:
+                    param_filepaths = collections.OrderedDict(
+                        (k, f.name) for k, f in param_files.items()
+                    )
+                    data = self.parse_in_chunks(config_data, source_filepath,
+                            param_filepaths)
+                else:
+                    data = self.parse_serially(config_data, source_file,
+                            param_files)
                 obj_data = {
-                    'data': list(gen_items),
+                    'data': data,
                     'meta': {
                         'format': self.extension,
                         'version': VERSION,
@@ -123,6 +486,226 @@ class Generator(object):
             for f in param_files.values():
                 f.close()
 
+    def parse_serially(self, config, source_file, param_files):
+        """Parse and transform the source in this process. With a preflight,
+          the lines that it reads are kept for the parser, so that each
+          file is only read once.
+        """
+
+        source_lines = Parser.gen_lines(source_file)
+        params = collections.OrderedDict()
+        stores = []
+        try:
+            if self.preflight_mode == u'off':
+                for key, f in param_files.items():
+                    params[key] = spill.store(Parser.gen_lines(f), self.budget)
+                    stores.append(params[key])
+            else:
+                structure = Structure(self.file_format)
+                tallies = {}
+                store = spill.create(self.budget)
+                stores.append(store)
+                tallies[source_file.name] = [structure.scan(source_lines,
+                        store)]
+                source_lines = store
+                for key, f in param_files.items():
+                    params[key] = spill.create(self.budget)
+                    stores.append(params[key])
+                    tally = structure.scan(Parser.gen_lines(f), params[key])
+                    tallies[f.name] = [tally]
+                param_filepaths = {k: f.name for k, f in param_files.items()}
+                for key in self.check_alignment(structure, source_file.name,
+                        param_filepaths, tallies):
+                    del params[key]
+            parser = Parser(config, source_lines, params, self.file_format,
+                    self.model_units, self.geometry_units)
+            return self.collect(parser())
+        finally:
+            for store in stores:
+                spill.close(store)
+
+    def collect(self, gen_items):
+        """Consume the items into a list or, if we have a budget, serialise
+          them into :class:`SerialisedItems` a chunk at a time.
+        """
+
+        if self.budget is None:
+            return list(gen_items)
+        data = SerialisedItems(self.budget)
+        try:
+            while True:
+                items = list(itertools.islice(gen_items, SERIAL_CHUNK_SIZE))
+                if not items:
+                    break
+                data.append_chunk(serialise_items(items), len(items))
+        except BaseException:
+            data.close()
+            raise
+        return data
+
+    def parse_in_chunks(self, config, source_filepath, param_filepaths):
+        """Parse and transform the source in a pool of ``self.processes``
+          worker processes. Returns the items as :class:`SerialisedItems`.
+
+          The parent process never reads the files. The workers first tally
+          the lines in byte ranges of every file, split at safe line
+          boundaries, so we know the item index at which each range starts
+          and can run the preflight. Then each worker parses one range of
+          the source, along with the same item indexes from each parameter
+          file.
+        """
+
+        param_filepaths = collections.OrderedDict(param_filepaths)
+        num_chunks = self.get_num_chunks(source_filepath)
+        filepaths = [source_filepath] + list(param_filepaths.values())
+        ranges = {fp: gen_ranges(fp, num_chunks) for fp in filepaths}
+        preflight = self.preflight_mode != u'off'
+        initargs = (config, self.file_format, self.model_units,
+                self.geometry_units, preflight)
+        with multiprocessing.Pool(self.processes, init_worker,
+                initargs) as pool:
+            # Tally the lines in each range.
+            scan_jobs = [
+                (fp, start, stop) for fp in filepaths
+                for start, stop in ranges[fp]
+            ]
+            results = iter(pool.map(scan_range, scan_jobs))
+            tallies = {fp: [next(results) for _ in ranges[fp]]
+                    for fp in filepaths}
+            if preflight:
+                structure = Structure(self.file_format)
+                for key in self.check_alignment(structure, source_filepath,
+                        param_filepaths, tallies):
+                    del param_filepaths[key]
+            firsts = {}
+            for fp in filepaths:
+                firsts[fp] = []
+                total = 0
+                for tally in tallies[fp]:
+                    firsts[fp].append(total)
+                    total += tally.lines
+            # Parse each range of the source.
+            jobs = self.gen_chunk_jobs(source_filepath, param_filepaths,
+                    ranges, firsts)
+            data = SerialisedItems(self.budget)
+            try:
+                for count, text in self.gen_results(pool, jobs):
+                    data.append_chunk(text, count)
+            except BaseException:
+                data.close()
+                raise
+        return data
+
+    def get_num_chunks(self, source_filepath):
+        """Split the source into a few chunks per process or, if we have a
+          budget, into enough chunks that the results in flight, which
+          the budget doesn't track, stay well within it.
+        """
+
+        num_chunks = self.processes * CHUNKS_PER_PROCESS
+        if self.budget is not None:
+            size = os.path.getsize(source_filepath) * OUTPUT_EXPANSION
+            in_flight = size * self.processes * 2 * 2
+            num_chunks = max(num_chunks, in_flight // self.budget.max_bytes + 1)
+        return num_chunks
+
+    def gen_chunk_jobs(self, source_filepath, param_filepaths, ranges, firsts):
+        """Yield a job for :func:`parse_chunk` per range of the source."""
+
+        source_ranges = ranges[source_filepath]
+        source_firsts = firsts[source_filepath]
+        num_lines = source_firsts[1:] + [None]
+        for k, (start, _) in enumerate(source_ranges):
+            first = source_firsts[k]
+            count = None if num_lines[k] is None else num_lines[k] - first
+            source_slice = (source_filepath, start, 0, count)
+            param_slices = {}
+            for key, fp in param_filepaths.items():
+                j = max(0, bisect.bisect_right(firsts[fp], first) - 1)
+                param_start = ranges[fp][j][0] if ranges[fp] else 0
+                param_first = firsts[fp][j] if firsts[fp] else 0
+                param_slices[key] = (fp, param_start, first - param_first,
+                        count)
+            yield source_slice, param_slices
+
+    def gen_results(self, pool, jobs):
+        """Run the jobs in the ``pool``, yielding their results in order.
+          We only keep a couple of jobs per process in flight, so finished
+          results don't pile up in memory.
+        """
+
+        pending = collections.deque()
+        for job in jobs:
+            pending.append(pool.apply_async(parse_chunk, (job,)))
+            if len(pending) >= self.processes * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+    def check_alignment(self, structure, source_filepath, param_filepaths,
+            tallies):
+        """Compare the fingerprint of each parameter file with the source's
+          before we start the expensive parse. Stores a :data:`Fingerprint`
+          per filename in ``self.fingerprints``, from the ``tallies`` of
+          each file's ranges.
+
+          In ``strict`` mode we raise a :class:`MisalignedError` at the first
+          misaligned parameter file. In ``warn`` mode we warn with a
+          :class:`MisalignedWarning` and return the keys of the parameters to drop, so no
+          transformations are derived from them.
+        """
+
+        self.fingerprints = {}
+        for filepath, file_tallies in tallies.items():
+            fingerprint = get_fingerprint(file_tallies)
+            name = os.path.basename(filepath)
+            self.fingerprints[name] = fingerprint
+            log.debug(u'{0}: {1}'.format(name, fingerprint))
+        source = self.fingerprints[os.path.basename(source_filepath)]
+        misaligned = []
+        for key, filepath in sorted(param_filepaths.items()):
+            if self.fingerprints[os.path.basename(filepath)] == source:
+                continue
+            msg = self.describe_divergence(structure, key, source_filepath,
+                    filepath)
+            if self.preflight_mode == u'strict':
+                raise MisalignedError(msg)
+            log.warn(msg)
+            warnings.warn(msg, MisalignedWarning)
+            misaligned.append(key)
+        return misaligned
+
+    def describe_divergence(self, structure, key, source_filepath,
+            param_filepath):
+        """Scan the source and a misaligned parameter file in lockstep to
+          find the first line at which their structure diverges.
+        """
+
+        filepaths = (source_filepath, param_filepath)
+        names = [os.path.basename(x) for x in filepaths]
+        lines = ((None, None), (None, None))
+        with open(source_filepath, 'r', encoding='latin-1') as source_file:
+            with open(param_filepath, 'r', encoding='latin-1') as param_file:
+                streams = [
+                    gen_numbered_lines(source_file),
+                    gen_numbered_lines(param_file),
+                ]
+                pairs = itertools.zip_longest(*streams,
+                        fillvalue=(None, None))
+                for pair in pairs:
+                    tokens = [structure.get_token(x[1]) for x in pair]
+                    tokens = [x and x[0] for x in tokens]
+                    if tokens[0] != tokens[1]:
+                        lines = pair
+                        break
+        source, param = [self.fingerprints[x] for x in names]
+        msg = (u'Parameter `{0}` diverges from the source at {1} of `{2}` '
+               u'and {3} of `{4}`: `{5}` != `{6}` ({7} vs {8} lines, {9} vs '
+               u'{10} vertices).')
+        return msg.format(key, get_position(lines[0][0]), names[0],
+                get_position(lines[1][0]), names[1], lines[0][1], lines[1][1],
+                source.lines, param.lines, source.vertices, param.vertices)
+
     def determine_extension(self, extension):
         valid_formats = [extension] if extension else FILE_FORMATS.keys()
         for k in FILE_FORMATS:
@@ -141,37 +724,35 @@ class Parser(object):
       Yields an item generator.
     """
 
-    def __init__(self, config, source_file, param_files, file_format,
+    def __init__(self, config, source_lines, params, file_format,
             model_units, geometry_units):
         self.config = config
         self.transformations = config.get('transformations', {})
-        self.source_file = source_file
-        self.params = {
-            k: list(self.gen_lines(v)) for k, v in param_files.items()
-        }
-        if self.params:
-            self.transform = self.apply_dynamic_transformations
-        else:
-            self.transform = self.apply_manual_transformations
+        self.source_lines = source_lines
+        self.params = params
         self.file_format = file_format
         self.model_units = model_units
         self.geometry_units = geometry_units
 
     def __call__(self):
-        gen_lines = self.gen_lines(self.source_file)
-        gen_items = self.parse(gen_lines)
+        gen_items = self.parse(self.source_lines)
         return self.transform(gen_items)
 
-    def gen_lines(self, obj_file):
+    def transform(self, gen_items):
+        if self.params:
+            return self.apply_dynamic_transformations(gen_items)
+        return self.apply_manual_transformations(gen_items)
+
+    @staticmethod
+    def gen_lines(obj_file):
         """Like ``obj_file.readlines()`` but capable of handling long lines
-          that are indented.
+          that are indented, i.e.: where a line ending with a backslash is
+          continued on the next line after a leading space.
+
+          Reads one line at a time, so we never hold the whole file.
         """
 
-        text = obj_file.read().replace(u'\\\n ', u'')
-        for line in text.split(u'\n'):
-            line = line.strip()
-            if line:
-                yield line
+        return (line for _, line in gen_numbered_lines(obj_file))
 
     def parse(self, gen_lines):
         match_expressions = self.file_format['match'].items()
@@ -213,12 +794,29 @@ class Parser(object):
         }
 
     def get_in_geom_units(self, config_item, key):
-        value = config_item.get(key)
+        return self.to_geom_units(config_item, config_item.get(key))
+
+    def to_geom_units(self, config_item, value):
         units = config_item.get('units', None)
         if units:
             value = convert_units(value, units, self.geometry_units)
         return value
 
+    def group_samples(self):
+        """Group the parameter files by parameter, returning a list of
+          ``(comparison_value, value_in_geom_units, alt_lines)`` for each.
+        """
+
+        samples = collections.OrderedDict()
+        for key, c in self.config['parameters'].items():
+            for name, value in get_samples(key, c):
+                if name not in self.params:
+                    continue
+                geom_value = self.to_geom_units(c, value)
+                sample = (value, geom_value, self.params[name])
+                samples.setdefault(key, []).append(sample)
+        return samples
+
     def apply_dynamic_transformations(self, gen_items):
         """For each dynamic parameter, check the source item against the
           corresponding item in the comparison file. If any of the
@@ -227,16 +825,23 @@ class Parser(object):
 
           In this way we *derive* transformation rules from the exported
           data, rather than having to define them ourselves.
+
+          Parameters exported at several comparison values are fitted
+          across all the samples, see :meth:`fit_samples`.
         """
 
+        samples = self.group_samples()
         for i, item in enumerate(gen_items):
             if 'geometry' in item:
-                for key, alt_lines in self.params.items():
-                    # Grab the difference between the default and the
-                    # deliberately changed value.
+                for key, key_samples in samples.items():
                     c = self.config['parameters'][key]
-                    comp_value = self.get_in_geom_units(c, 'comparison_value')
                     init_value = self.get_in_geom_units(c, 'initial_value')
+                    if len(key_samples) > 1:
+                        self.fit_samples(item, i, key, init_value, key_samples)
+                        continue
+                    # Grab the difference between the default and the
+                    # deliberately changed value.
+                    _, comp_value, alt_lines = key_samples[0]
                     diff_param = comp_value - init_value
                     # Get the corresponding value.
                     alt_line = alt_lines[i]
@@ -267,6 +872,62 @@ class Parser(object):
                               }
             yield item
 
+    def fit_samples(self, item, i, key, init_value, samples):
+        """Fit the changes in the item's geometry across all the samples of
+          a parameter. Where a least squares line through the initial value
+          fits every sample, add the same ``add`` transformation as for a
+          single sample. Otherwise, add an ``interpolate`` transformation
+          with a table of ``[parameter_value, offset]`` knots, sorted by
+          parameter value, for the client to interpolate between.
+        """
+
+        c = self.config['parameters'][key]
+        alt_items = [
+            (value, comp_value - init_value,
+                    self.parse_geometry(alt_lines[i], item['type']))
+            for value, comp_value, alt_lines in samples
+        ]
+        for axis in AXIS:
+            geom_value = item['geometry'].get(axis)
+            points = [
+                (value, diff_param, alt_item['geometry'].get(axis) - geom_value)
+                for value, diff_param, alt_item in alt_items
+            ]
+            if not any(diff_value for _, _, diff_value in points):
+                continue
+            sum_xx = sum(x * x for _, x, _ in points)
+            if not sum_xx:
+                continue
+            factor = sum(x * y for _, x, y in points) / sum_xx
+            residual = max(abs(y - factor * x) for _, x, y in points)
+            scale = max([1.0, abs(geom_value)] + [abs(y) for _, _, y in points])
+            if residual <= FIT_TOLERANCE * scale:
+                if geom_value < 0:
+                    factor = 0 - factor
+                instruction = {
+                    'use': 'add',
+                    'args': [
+                        '@',
+                        '${0}'.format(key),
+                        factor,
+                    ]
+                }
+            else:
+                table = [[c['initial_value'], 0.0]]
+                table += [[value, y] for value, _, y in points]
+                instruction = {
+                    'use': 'interpolate',
+                    'args': [
+                        '@',
+                        '${0}'.format(key),
+                        sorted(table),
+                    ]
+                }
+            if item.get('transformations') is None:
+                item['transformations'] = {}
+            transformation_key = '{0}_by_{1}'.format(axis, key)
+            item['transformations'][transformation_key] = {axis: instruction}
+
     def apply_manual_transformations(self, gen_items):
         """Apply any transformation rules in the ``config.json``."""
 
@@ -9,9 +9,13 @@ import glob
 import json
 import os
 import os.path
+import sys
+import warnings
 
+from . import delta as delta_
 from . import generate
 from . import log
+from . import spill
 
 HERE = os.path.dirname(__file__)
 
@@ -37,13 +41,56 @@ def get_output_dir():
     default = default_output_dir()
     return os.environ.get(key, default)
 
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(u'must be at least 1')
+    return number
+
+def write_obj_json(obj_data, f):
+    """Write ``json.dumps(obj_data, indent=2)`` to ``f`` one item at a time,
+      so that ``obj_data['data']`` can be a disk backed sequence. Items
+      that the worker processes already serialised are written as is.
+    """
+
+    f.write(u'{')
+    for i, (key, value) in enumerate(obj_data.items()):
+        f.write(u',\n  ' if i else u'\n  ')
+        f.write(u'{0}: '.format(json.dumps(key)))
+        if key != 'data':
+            f.write(generate.dump_json(value, u'\n  '))
+            continue
+        if not len(value):
+            f.write(u'[]')
+            continue
+        if isinstance(value, generate.SerialisedItems):
+            chunks = value.gen_json()
+        else:
+            chunks = (generate.dump_json(x, generate.ITEM_PREFIX) for x in value)
+        f.write(u'[')
+        for j, chunk in enumerate(chunks):
+            f.write(generate.ITEM_SEPARATOR if j else generate.ITEM_PREFIX)
+            f.write(chunk)
+        f.write(u'\n  ]')
+    f.write(u'\n}')
+
 def write_to_filesystem(name, target_dir, model_units, geometry_units,
-        extension, output_dir=None):
-    """Python entry point to write the generated files to an output folder."""
+        extension, output_dir=None, processes=None, preflight=u'strict',
+        delta=False, max_memory=None):
+    """Python entry point to write the generated files to an output folder.
+
+      With ``delta``, stamp the output with a version id and, if a previous
+      compile with a version id exists in the output folder, also write a
+      ``delta-$from-$to.json`` that patches it into this one.
+
+      With ``max_memory``, spill the parsed data to disk once it exceeds
+      that many bytes.
+    """
 
     # Parse the target_dir to generate the data.
     generator = generate.Generator(target_dir, model_units, geometry_units,
-            extension=extension)
+            extension=extension, processes=processes, preflight=preflight,
+            max_memory=max_memory)
     obj_data, config_data = generator()
 
     # Make sure the output folder exists.
@@ -52,29 +99,40 @@ def write_to_filesystem(name, target_dir, model_units, geometry_units,
     model_dir = os.path.join(output_dir, name)
     if not os.path.exists(model_dir):
         os.makedirs(model_dir)
-
-    # Write the `obj.json`.
-    obj_json = json.dumps(obj_data, indent=2)
     obj_filepath = os.path.join(model_dir, 'obj.json')
-    with open(obj_filepath, 'w') as f:
-        f.write(obj_json)
+    config_filepath = os.path.join(model_dir, 'config.json')
+
+    try:
+        # Write the delta from the previous compile, if any.
+        if delta:
+            version_id = delta_.version_id(obj_data, config_data)
+            obj_data['meta']['version_id'] = version_id
+            delta_.write_delta_file(model_dir, obj_data, config_data)
+
+        # Write the `obj.json`.
+        with open(obj_filepath, 'w') as f:
+            write_obj_json(obj_data, f)
+    finally:
+        spill.close(obj_data['data'])
 
     # Write the `config.json`.
     config_json = json.dumps(config_data, indent=2)
-    config_filepath = os.path.join(model_dir, 'config.json')
     with open(config_filepath, 'w') as f:
         f.write(config_json)
 
     return model_dir
 
 def post_to_webserver(name, target_dir, model_units, geometry_units,
-        extension, **kwargs):
+        extension, processes=None, preflight=u'strict', delta=False,
+        max_memory=None, **kwargs):
     """XXX"""
 
     # Parse the target_dir to generate the data.
     generator = generate.Generator(target_dir, model_units, geometry_units,
-            extension=extension)
+            extension=extension, processes=processes, preflight=preflight,
+            max_memory=max_memory)
     obj_data, config_data = generator()
+    spill.close(obj_data['data'])
 
     # XXX Post to an API endpoint.
     raise NotImplementedError
@@ -88,6 +146,11 @@ def parse_args():
     parser.add_argument('--output', default=None)
     parser.add_argument('--model-units', default='cm')
     parser.add_argument('--geometry-units', default='mm')
+    parser.add_argument('--processes', type=positive_int, default=None)
+    parser.add_argument('--preflight', default=u'strict',
+            choices=generate.PREFLIGHT_MODES)
+    parser.add_argument('--delta', action='store_true')
+    parser.add_argument('--max-memory', type=spill.parse_size, default=None)
     return parser.parse_args()
 
 def main():
@@ -98,17 +161,33 @@ def main():
         exporter = write_to_filesystem
         kwargs = {
             'output_dir': args.output,
+            'delta': args.delta,
         }
     else:
         exporter = post_to_webserver
         kwargs = {}
+    kwargs['processes'] = args.processes
+    kwargs['preflight'] = args.preflight
+    kwargs['max_memory'] = args.max_memory
     target_dir = args.target_dir
     name = args.name if args.name else os.path.basename(target_dir)
     model_units = args.model_units
     geometry_units = args.geometry_units
     print('Compiling {0}'.format(name))
-    output = exporter(name, target_dir, model_units, geometry_units,
-            args.extension, **kwargs)
+    try:
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always', generate.MisalignedWarning)
+            output = exporter(name, target_dir, model_units, geometry_units,
+                    args.extension, **kwargs)
+    except generate.MisalignedError as err:
+        print(u'Error: {0}'.format(err), file=sys.stderr)
+        sys.exit(1)
+    for warning in caught:
+        if issubclass(warning.category, generate.MisalignedWarning):
+            print(u'Warning: {0}'.format(warning.message), file=sys.stderr)
+        else:
+            warnings.showwarning(warning.message, warning.category,
+                    warning.filename, warning.lineno)
     print('Output:')
     print('- filesystem:')
     print(output)
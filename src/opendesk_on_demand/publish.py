@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+"""Publish the compiled models in an output folder as static assets:
+
+      $ publish --output .build --publish .build/.publish
+
+  Each model's ``obj.json`` and ``config.json`` is copied to a content
+  hashed filename, e.g.: ``box/obj.3f2a9c1b04de.json``, alongside a
+  precompressed ``.gz`` variant. Hashed files are never overwritten, so
+  files that already exist in the publish folder are skipped and can be
+  served with long lived cache headers. A ``catalogue.json`` indexes the
+  current files for every model (with the ``path`` and ``gz_path`` of
+  each), its version id and the deltas that lead to it, by the version
+  they patch from.
+"""
+
+from __future__ import print_function
+
+import argparse
+import concurrent.futures
+import glob
+import gzip
+import hashlib
+import io
+import json
+import os
+import os.path
+import shutil
+
+from . import delta
+from . import generate
+from . import log
+from . import main as main_
+
+BLOCK_SIZE = 1024 * 1024
+CATALOGUE_NAME = 'catalogue.json'
+FILE_NAMES = (
+    'obj.json',
+    'config.json',
+)
+
+def get_publish_dir(output_dir):
+    key = 'OPENDESK_ON_DEMAND_PUBLISH_DIR'
+    default = os.path.join(output_dir, '.publish')
+    return os.environ.get(key, default)
+
+def write_file(filepath, source, compress=False, overwrite=False):
+    """Copy the binary file object ``source`` to ``filepath`` a block at a
+      time, unless the file already exists. Returns whether the file was
+      written.
+    """
+
+    if os.path.exists(filepath) and not overwrite:
+        return False
+    tmp_filepath = '{0}.tmp'.format(filepath)
+    with open(tmp_filepath, 'wb') as f:
+        if compress:
+            with gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as gz:
+                shutil.copyfileobj(source, gz, BLOCK_SIZE)
+        else:
+            shutil.copyfileobj(source, f, BLOCK_SIZE)
+    os.rename(tmp_filepath, filepath)
+    return True
+
+def publish_file(source_filepath, target_dir):
+    """Hash the source file and write its hashed and gzipped variants to
+      the ``target_dir``, reading it a block at a time. Returns the hashed
+      filename, the size of the source file and the number of files
+      written.
+    """
+
+    digest = hashlib.sha1()
+    size = 0
+    with open(source_filepath, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            digest.update(block)
+            size += len(block)
+        stem, ext = os.path.splitext(os.path.basename(source_filepath))
+        filename = '{0}.{1}{2}'.format(stem, digest.hexdigest()[:12], ext)
+        filepath = os.path.join(target_dir, filename)
+        written = 0
+        for target_filepath, compress in ((filepath, False),
+                ('{0}.gz'.format(filepath), True)):
+            f.seek(0)
+            written += write_file(target_filepath, f, compress=compress)
+    return filename, size, written
+
+def get_delta_names(model_dir):
+    """Return the names of the delta files in a model folder."""
+
+    filepaths = glob.glob(os.path.join(model_dir, 'delta-*.json'))
+    names = [os.path.basename(x) for x in filepaths]
+    return sorted(x for x in names if delta.parse_name(x) is not None)
+
+def read_version_id(obj_filepath):
+    with open(obj_filepath, 'r') as f:
+        return delta.read_meta(f).get('version_id')
+
+def gen_models(output_dir):
+    """Yield the name of every compiled model in the ``output_dir``."""
+
+    for name in sorted(os.listdir(output_dir)):
+        if name.startswith('.'):
+            continue
+        model_dir = os.path.join(output_dir, name)
+        filepaths = [os.path.join(model_dir, x) for x in FILE_NAMES]
+        if all(os.path.isfile(x) for x in filepaths):
+            yield name
+
+def publish(output_dir=None, publish_dir=None, workers=None):
+    """Python entry point to publish every compiled model in the
+      ``output_dir`` to the ``publish_dir``. Returns the catalogue.
+    """
+
+    if output_dir is None:
+        output_dir = main_.get_output_dir()
+    if publish_dir is None:
+        publish_dir = get_publish_dir(output_dir)
+    if not os.path.exists(publish_dir):
+        os.makedirs(publish_dir)
+
+    # Hash and compress all the files concurrently.
+    futures = {}
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        for name in gen_models(output_dir):
+            target_dir = os.path.join(publish_dir, name)
+            if not os.path.exists(target_dir):
+                os.makedirs(target_dir)
+            model_dir = os.path.join(output_dir, name)
+            filenames = list(FILE_NAMES) + get_delta_names(model_dir)
+            for filename in filenames:
+                source_filepath = os.path.join(model_dir, filename)
+                future = executor.submit(publish_file, source_filepath,
+                        target_dir)
+                futures[(name, filename)] = future
+
+    # Build the catalogue from the results.
+    models = {}
+    num_written = 0
+    for (name, filename), future in sorted(futures.items()):
+        hashed_filename, size, written = future.result()
+        num_written += written
+        model = models.setdefault(name, {})
+        path = '{0}/{1}'.format(name, hashed_filename)
+        value = {
+            'path': path,
+            'gz_path': '{0}.gz'.format(path),
+            'size': size,
+        }
+        ids = delta.parse_name(filename)
+        if ids is None:
+            model[os.path.splitext(filename)[0]] = value
+        else:
+            value['to'] = ids[1]
+            model.setdefault('deltas', {})[ids[0]] = value
+    for name, model in models.items():
+        obj_filepath = os.path.join(output_dir, name, 'obj.json')
+        model['version'] = read_version_id(obj_filepath)
+    log.info(u'Published {0} models, wrote {1} files.'.format(len(models),
+            num_written))
+
+    # Always rewrite the catalogue, as it's the unhashed entry point. It's
+    # small and not cached, so we don't precompress it.
+    catalogue = {
+        'models': models,
+        'meta': {
+            'version': generate.VERSION,
+        },
+    }
+    catalogue_json = json.dumps(catalogue, indent=2).encode('utf-8')
+    catalogue_filepath = os.path.join(publish_dir, CATALOGUE_NAME)
+    write_file(catalogue_filepath, io.BytesIO(catalogue_json),
+            overwrite=True)
+    return catalogue
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--publish', default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    return parser.parse_args()
+
+def main():
+    """Command line entry point."""
+
+    args = parse_args()
+    output_dir = args.output if args.output else main_.get_output_dir()
+    publish_dir = args.publish if args.publish else get_publish_dir(output_dir)
+    print('Publishing {0}'.format(output_dir))
+    catalogue = publish(output_dir, publish_dir, workers=args.workers)
+    print('Output:')
+    print('- filesystem:')
+    print(publish_dir)
+    print('- models:')
+    for name in sorted(catalogue['models']):
+        print(name)
+
+if __name__ == '__main__':
+    main()
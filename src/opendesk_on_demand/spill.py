@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+"""Keep the data held by the compiler within a memory budget.
+
+  A :class:`SpillList` is an append only sequence of strings that holds
+  them, encoded, in memory until the :class:`Budget` it shares with the
+  other lists is exceeded. It then spills them to a temporary file, which
+  it reads them back from one at a time, with their offsets in a second
+  temporary file, so that it holds almost nothing in memory.
+"""
+
+import os
+import struct
+import sys
+import tempfile
+
+from . import log
+
+ENCODING = 'utf-8'
+HAS_PREAD = hasattr(os, 'pread')
+OFFSET = struct.Struct('<q')
+POINTER_SIZE = 8
+SIZE_UNITS = {
+    'K': 1024,
+    'M': 1024 ** 2,
+    'G': 1024 ** 3,
+}
+
+def parse_size(value):
+    """Parse a number of bytes, optionally suffixed with `K`, `M` or `G`."""
+
+    value = value.strip().upper().rstrip('B')
+    multiplier = SIZE_UNITS.get(value[-1:], None)
+    if multiplier is None:
+        size = int(value)
+    else:
+        size = int(float(value[:-1]) * multiplier)
+    if size < 1:
+        raise ValueError(u'A size must be at least 1 byte.')
+    return size
+
+def read_at(f, offset, size):
+    """Read ``size`` bytes at ``offset`` in the file. Uses ``os.pread``
+      where we have it, which leaves the file position alone; otherwise
+      (e.g.: on Windows) seeks, so the caller must seek back to the end
+      before writing again.
+    """
+
+    if HAS_PREAD:
+        return os.pread(f.fileno(), size, offset)
+    f.seek(offset)
+    return f.read(size)
+
+def create(budget):
+    """Return an empty list or, if we have a ``budget``, :class:`SpillList`."""
+
+    if budget is None:
+        return []
+    return SpillList(budget)
+
+def store(iterable, budget):
+    """Consume the ``iterable`` of strings into a list or, if we have a
+      ``budget``, into a :class:`SpillList`.
+    """
+
+    if budget is None:
+        return list(iterable)
+    items = create(budget)
+    for item in iterable:
+        items.append(item)
+    return items
+
+def close(items):
+    """Release the memory and temporary file held by disk backed ``items``."""
+
+    if hasattr(items, 'close'):
+        items.close()
+
+class Budget(object):
+    """The number of bytes that the :class:`SpillList` instances sharing
+      this budget may hold in memory.
+    """
+
+    def __init__(self, max_bytes, spill_dir=None):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.used = 0
+
+    def charge(self, num_bytes):
+        """Returns whether we're still within budget."""
+
+        self.used += num_bytes
+        return self.used <= self.max_bytes
+
+    def release(self, num_bytes):
+        self.used -= num_bytes
+
+class SpillList(object):
+    """An append only sequence of strings that spills to disk when over
+      budget. Holds the strings encoded, and charges the budget the size
+      of the encoded objects, plus a pointer to each, as that's what they
+      take up in memory.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.items = []
+        self.held = 0
+        self.file = None
+        self.offsets_file = None
+        self.is_flushed = True
+        self.length = 0
+        self.size = 0
+
+    def __len__(self):
+        if self.file is None:
+            return len(self.items)
+        return self.length
+
+    def __iter__(self):
+        if self.file is None:
+            return (x.decode(ENCODING) for x in self.items)
+        return (self[i] for i in range(len(self)))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if self.file is None:
+            return self.items[index].decode(ENCODING)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('SpillList index out of range')
+        if not self.is_flushed:
+            self.file.flush()
+            self.offsets_file.flush()
+            self.is_flushed = True
+        data = read_at(self.offsets_file, index * OFFSET.size, OFFSET.size * 2)
+        start, stop = struct.unpack('<2q', data)
+        return read_at(self.file, start, stop - start).decode(ENCODING)
+
+    def append(self, item):
+        data = item.encode(ENCODING)
+        if self.file is not None:
+            return self.write(data)
+        self.items.append(data)
+        size = sys.getsizeof(data) + POINTER_SIZE
+        self.held += size
+        if not self.budget.charge(size):
+            self.spill()
+
+    def write(self, data):
+        if not HAS_PREAD:
+            self.file.seek(0, os.SEEK_END)
+            self.offsets_file.seek(0, os.SEEK_END)
+        self.file.write(data)
+        self.size += len(data)
+        self.offsets_file.write(OFFSET.pack(self.size))
+        self.length += 1
+        self.is_flushed = False
+
+    def spill(self):
+        """Move the items held in memory to a temporary file."""
+
+        log.debug(u'Spilling {0} items to disk.'.format(len(self.items)))
+        self.file = tempfile.TemporaryFile(dir=self.budget.spill_dir)
+        self.offsets_file = tempfile.TemporaryFile(dir=self.budget.spill_dir)
+        self.offsets_file.write(OFFSET.pack(0))
+        items, self.items = self.items, []
+        for data in items:
+            self.write(data)
+        self.budget.release(self.held)
+        self.held = 0
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.offsets_file.close()
+            self.file = None
+            self.offsets_file = None
+        self.items = []
+        self.length = 0
+        self.size = 0
+        self.budget.release(self.held)
+        self.held = 0
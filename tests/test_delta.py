@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the deltas between compiles."""
+
+import json
+import os
+import os.path
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+from opendesk_on_demand import delta
+from opendesk_on_demand import generate
+from opendesk_on_demand import main
+
+class TestDelta(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.model_dir = os.path.join(self.tmp_dir, 'box')
+        os.makedirs(self.model_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def compile(self, items, config_data):
+        obj_data = {
+            'data': items,
+            'meta': {'format': u'stl', 'version': generate.VERSION},
+        }
+        obj_data['meta']['version_id'] = delta.version_id(obj_data,
+                config_data)
+        filepath = delta.write_delta_file(self.model_dir, obj_data,
+                config_data)
+        with open(os.path.join(self.model_dir, 'obj.json'), 'w') as f:
+            main.write_obj_json(obj_data, f)
+        with open(os.path.join(self.model_dir, 'config.json'), 'w') as f:
+            f.write(json.dumps(config_data, indent=2))
+        return json.loads(json.dumps(obj_data)), filepath
+
+    def test_delta_patches_the_previous_compile(self):
+        rnd = random.Random(3)
+        config_data = {u'parameters': {}, u'a': 1}
+        old_items = [
+            {u'type': u'vertex', u'geometry': {u'x': i},
+             u'transformations': [{u'x': i}]}
+            for i in range(50)
+        ]
+        old_obj_data, filepath = self.compile(old_items, config_data)
+        self.assertIsNone(filepath)
+        for _ in range(20):
+            items = json.loads(json.dumps(old_obj_data['data']))
+            for item in rnd.sample(items, 5):
+                item[u'geometry'][u'x'] = rnd.random()
+            for item in rnd.sample(items, 5):
+                item.pop(u'transformations', None)
+            items = items[:rnd.randint(40, 50)] + items[:rnd.randint(0, 5)]
+            new_config_data = {u'parameters': {}, u'b': rnd.random()}
+            new_obj_data, filepath = self.compile(items, new_config_data)
+            with open(filepath, 'r') as f:
+                delta_data = json.loads(f.read())
+            patched = delta.patch(old_obj_data, config_data, delta_data)
+            self.assertEqual(patched, (new_obj_data, new_config_data))
+            old_obj_data, config_data = new_obj_data, new_config_data
+        filenames = os.listdir(self.model_dir)
+        num_deltas = len([x for x in filenames if x.startswith('delta-')])
+        self.assertEqual(num_deltas, delta.MAX_DELTAS)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the compiler: run with ``python -m pytest`` or
+  ``python -m unittest discover tests`` from the repo root.
+"""
+
+import copy
+import io
+import json
+import os
+import os.path
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+import warnings
+
+HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+from opendesk_on_demand import generate
+from opendesk_on_demand import main
+from opendesk_on_demand import spill
+
+CONFIG = {
+    'parameters': {
+        'height': {
+            'name': 'height',
+            'units': 'mm',
+            'initial_value': 100,
+            'comparison_value': 102,
+            'value': {
+                'type': 'numeric::range',
+                'min': 50,
+                'max': 200,
+            },
+        },
+    },
+}
+FRAGMENTS = (
+    u'a',
+    u' ',
+    u'\\',
+    u'\n',
+    u'\r',
+    u'\r\n',
+    u'vertex 1',
+)
+
+def read_lines(text):
+    """How the compiler read lines before it streamed them."""
+
+    text = text.replace(u'\\\n ', u'')
+    return [x.strip() for x in text.split(u'\n') if x.strip()]
+
+def random_text(rnd, length):
+    return u''.join(rnd.choice(FRAGMENTS) for _ in range(length))
+
+def write_stl(filepath, num_facets, height=0.0, tail=u'', base=0.0):
+    """Write a model whose top vertices move with the ``height``, with a
+      line continued on the next, to a file. The ``base`` offsets every
+      ``z``, e.g.: to put the model below the origin.
+    """
+
+    lines = [u'solid box']
+    for i in range(num_facets):
+        lines.append(u'  facet normal 0 0 \\\n 1')
+        lines.append(u'    outer loop')
+        for j in range(3):
+            z = base + i + j
+            if j == 2:
+                z += height
+            lines.append(u'      vertex {0} {1} {2}'.format(i, j, z))
+        lines.append(u'    endloop')
+        lines.append(u'  endfacet')
+    lines.append(u'endsolid box')
+    with open(filepath, 'w') as f:
+        f.write(u'\n'.join(lines) + tail)
+
+def compile_obj_json(generator):
+    obj_data, _ = generator()
+    f = io.StringIO()
+    try:
+        main.write_obj_json(obj_data, f)
+    finally:
+        spill.close(obj_data['data'])
+    return f.getvalue()
+
+class TestGenLines(unittest.TestCase):
+    def test_matches_reading_the_whole_file(self):
+        rnd = random.Random(1)
+        for _ in range(20000):
+            text = random_text(rnd, rnd.randint(0, 30))
+            stream = io.StringIO(text, newline=None)
+            lines = list(generate.Parser.gen_lines(stream))
+            self.assertEqual(lines, read_lines(stream.getvalue()), repr(text))
+
+    def test_numbers_the_line_each_line_starts_on(self):
+        stream = io.StringIO(u'a\n\nb \\\n c\nd\n')
+        lines = list(generate.gen_numbered_lines(stream))
+        self.assertEqual(lines, [(1, u'a'), (3, u'b c'), (5, u'd')])
+
+class TestRanges(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.tmp_dir, 'lines.txt')
+        generate.init_worker({}, generate.FILE_FORMATS['stl'], 'cm', 'mm',
+                True)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_ranges_split_at_line_boundaries(self):
+        rnd = random.Random(2)
+        for _ in range(2000):
+            text = random_text(rnd, rnd.randint(0, 60))
+            with open(self.filepath, 'w', newline='') as f:
+                f.write(text)
+            with open(self.filepath, 'r', encoding='latin-1') as f:
+                expected = list(generate.Parser.gen_lines(f))
+            ranges = generate.gen_ranges(self.filepath, rnd.randint(1, 8))
+            lines = []
+            for start, stop in ranges:
+                job = (self.filepath, start, stop)
+                count = generate.scan_range(job).lines
+                lines += generate.read_slice(self.filepath, start, 0, count)
+            self.assertEqual(lines, expected, repr(text))
+
+class TestDumpJson(unittest.TestCase):
+    def test_matches_the_indenting_encoder(self):
+        values = [
+            {},
+            [],
+            {u'a': [1, 2.5, -0.0, 1e-07, None, True, False]},
+            {u'é"\\': {u'b': [[], {}, [{}]], u'c': u'☃\n'}},
+            [float('inf'), -float('inf'), 12345678901234567890],
+        ]
+        for value in values:
+            expected = json.dumps(value, indent=2).replace(u'\n', u'\n    ')
+            self.assertEqual(generate.dump_json(value, u'\n    '), expected)
+
+class TestGenerator(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.target_dir = os.path.join(self.tmp_dir, 'box')
+        os.makedirs(self.target_dir)
+        with open(os.path.join(self.target_dir, 'config.json'), 'w') as f:
+            f.write(json.dumps(CONFIG))
+        write_stl(os.path.join(self.target_dir, 'source.stl'), 200)
+        write_stl(os.path.join(self.target_dir, 'height.stl'), 200, 2.0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def generator(self, **kwargs):
+        return generate.Generator(self.target_dir, 'mm', 'mm', **kwargs)
+
+    def test_modes_write_the_same_output(self):
+        expected = compile_obj_json(self.generator())
+        obj_data = json.loads(expected)
+        self.assertEqual(len(obj_data['data']), 200 * 7 + 2)
+        kwargs_list = [
+            {'preflight': u'off'},
+            {'max_memory': 1024},
+            {'processes': 2},
+            {'processes': 3, 'max_memory': 1024},
+        ]
+        for kwargs in kwargs_list:
+            output = compile_obj_json(self.generator(**kwargs))
+            self.assertEqual(output, expected, kwargs)
+
+    def test_empty_source_writes_no_data(self):
+        config_data = {'parameters': {}}
+        with open(os.path.join(self.target_dir, 'config.json'), 'w') as f:
+            f.write(json.dumps(config_data))
+        os.remove(os.path.join(self.target_dir, 'height.stl'))
+        with open(os.path.join(self.target_dir, 'source.stl'), 'w') as f:
+            f.write(u'')
+        kwargs_list = [
+            {},
+            {'max_memory': 1024},
+            {'processes': 2},
+            {'processes': 2, 'max_memory': 1024},
+        ]
+        for kwargs in kwargs_list:
+            obj_data = json.loads(compile_obj_json(self.generator(**kwargs)))
+            self.assertEqual(obj_data['data'], [], kwargs)
+
+    def test_budget_is_released(self):
+        generator = self.generator(max_memory=1024)
+        for _ in range(2):
+            obj_data, _ = generator()
+            spill.close(obj_data['data'])
+            self.assertEqual(generator.budget.used, 0)
+
+    def test_rejects_no_processes(self):
+        with self.assertRaises(ValueError):
+            self.generator(processes=0)
+
+    def test_rejects_no_budget(self):
+        with self.assertRaises(ValueError):
+            self.generator(max_memory=0)
+
+    def test_preflight_reports_file_lines(self):
+        write_stl(os.path.join(self.target_dir, 'height.stl'), 200, 2.0,
+                tail=u'\nsolid extra')
+        for processes in (None, 2):
+            generator = self.generator(processes=processes)
+            with self.assertRaises(generate.MisalignedError) as cm:
+                generator()
+            msg = str(cm.exception)
+            self.assertIn(u'the end of `source.stl`', msg)
+            self.assertIn(u'line 1603 of `height.stl`', msg)
+
+    def test_preflight_warn_drops_the_parameter(self):
+        write_stl(os.path.join(self.target_dir, 'height.stl'), 199, 2.0)
+        generator = self.generator(preflight=u'warn')
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            obj_data, _ = generator()
+        self.assertEqual(len(caught), 1)
+        self.assertIs(caught[0].category, generate.MisalignedWarning)
+        self.assertIn(u'`height.stl`', str(caught[0].message))
+        items = [x for x in obj_data['data'] if x['type'] == u'vertex']
+        self.assertFalse(any(x.get('transformations') for x in items))
+
+class TestSamples(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_model(self, name, samples, base=0.0):
+        """Write a model with the ``height`` exported at each of the
+          ``(comparison_value, height)`` samples, as ``height.$n.stl``
+          or, given one sample, as ``height.stl``.
+        """
+
+        target_dir = os.path.join(self.tmp_dir, name)
+        os.makedirs(target_dir)
+        config_data = copy.deepcopy(CONFIG)
+        c = config_data['parameters']['height']
+        if len(samples) == 1:
+            c['comparison_value'] = samples[0][0]
+            filenames = ['height.stl']
+        else:
+            del c['comparison_value']
+            c['comparison_values'] = [x for x, _ in samples]
+            filenames = [
+                'height.{0}.stl'.format(i) for i in range(len(samples))
+            ]
+        with open(os.path.join(target_dir, 'config.json'), 'w') as f:
+            f.write(json.dumps(config_data))
+        write_stl(os.path.join(target_dir, 'source.stl'), 50, base=base)
+        for filename, (_, height) in zip(filenames, samples):
+            filepath = os.path.join(target_dir, filename)
+            write_stl(filepath, 50, height, base=base)
+        return target_dir
+
+    def compile(self, target_dir, **kwargs):
+        generator = generate.Generator(target_dir, 'mm', 'mm', **kwargs)
+        return json.loads(compile_obj_json(generator))
+
+    def get_instructions(self, obj_data):
+        """Return the ``z`` and the instruction of each transformed item."""
+
+        return [
+            (x['geometry']['z'], x['transformations']['z_by_height']['z'])
+            for x in obj_data['data'] if x.get('transformations')
+        ]
+
+    def test_gets_a_sample_per_file(self):
+        c = CONFIG['parameters']['height']
+        self.assertEqual(generate.get_samples(u'height', c),
+                [(u'height', 102)])
+        c = {'comparison_values': [104, 102]}
+        self.assertEqual(generate.get_samples(u'height', c),
+                [(u'height.0', 104), (u'height.1', 102)])
+
+    def test_linear_samples_add_like_a_single_sample(self):
+        for base in (0.0, -1000.0):
+            name = 'linear{0}'.format(base)
+            target_dir = self.write_model(name, [(102, 2.0), (104, 4.0)],
+                    base)
+            obj_data = self.compile(target_dir)
+            single_dir = self.write_model(name + 'single', [(102, 2.0)], base)
+            self.assertEqual(obj_data, self.compile(single_dir))
+            instructions = self.get_instructions(obj_data)
+            self.assertEqual(len(instructions), 50)
+            for z, instruction in instructions:
+                factor = 1.0 if z > 0 else -1.0
+                self.assertEqual(instruction['use'], u'add')
+                self.assertEqual(instruction['args'][2], factor)
+
+    def test_non_linear_samples_interpolate(self):
+        samples = [(104, 5.0), (101, 0.5), (102, 2.0)]
+        table = [[100, 0.0], [101, 0.5], [102, 2.0], [104, 5.0]]
+        for base in (0.0, -1000.0):
+            target_dir = self.write_model('curve{0}'.format(base), samples,
+                    base)
+            instructions = self.get_instructions(self.compile(target_dir))
+            self.assertEqual(len(instructions), 50)
+            for z, instruction in instructions:
+                # The offsets aren't sign flipped, unlike the `add` factor.
+                self.assertEqual(instruction, {
+                    u'use': u'interpolate',
+                    u'args': [u'@', u'$height', table],
+                })
+
+    def test_modes_fit_the_same_samples(self):
+        target_dir = self.write_model('modes', [(102, 2.0), (104, 5.0)])
+        expected = self.compile(target_dir)
+        kwargs_list = [
+            {'preflight': u'off'},
+            {'max_memory': 1024},
+            {'processes': 2},
+            {'processes': 2, 'max_memory': 1024},
+        ]
+        for kwargs in kwargs_list:
+            self.assertEqual(self.compile(target_dir, **kwargs), expected,
+                    kwargs)
+
+    def test_preflight_checks_every_sample(self):
+        target_dir = self.write_model('misaligned', [(102, 2.0), (104, 5.0)])
+        write_stl(os.path.join(target_dir, 'height.1.stl'), 49, 5.0)
+        for processes in (None, 2):
+            with self.assertRaises(generate.MisalignedError) as cm:
+                self.compile(target_dir, processes=processes)
+            self.assertIn(u'`height.1.stl`', str(cm.exception))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the client's transformation functions, which we run in node,
+  so skip where it isn't installed.
+"""
+
+import json
+import os.path
+import shutil
+import subprocess
+import unittest
+
+HERE = os.path.dirname(__file__)
+ROOT = os.path.abspath(os.path.join(HERE, '..'))
+NODE = shutil.which('node')
+
+# Compile the client lib with the vendored CoffeeScript and call each of
+# the `[function_name, args]` read from stdin, writing the results.
+SCRIPT = u'''
+var fs = require('fs');
+var root = process.argv[1];
+global.window = {addEventListener: function () {}};
+var module_ = {exports: {}};
+var source = fs.readFileSync(root + '/vendor/coffeescript.js', 'utf8');
+new Function('module', 'exports', 'require', source).call(global, module_,
+    module_.exports, require);
+var CoffeeScript = global.CoffeeScript || module_.exports;
+global.window = global;
+['namespace', 'lib'].forEach(function (name) {
+  var filepath = root + '/src/client/' + name + '.coffee';
+  eval(CoffeeScript.compile(fs.readFileSync(filepath, 'utf8')));
+});
+var lib = window.opendesk.on_demand.lib;
+var calls = JSON.parse(fs.readFileSync(0, 'utf8'));
+process.stdout.write(JSON.stringify(calls.map(function (call) {
+  return lib[call[0]].apply(null, call[1]);
+})));
+'''
+PARAMS = {
+    'height': {
+        'initial_value': 100,
+    },
+}
+TABLE = [[100, 0.0], [101, 0.5], [102, 2.0], [104, 5.0]]
+
+@unittest.skipIf(NODE is None, 'node is not installed')
+class TestLib(unittest.TestCase):
+    def call(self, function_name, calls):
+        """Call the lib function with each of the ``(choice, args)``."""
+
+        data = [
+            [function_name, [PARAMS, {'height': choice}] + list(args)]
+            for choice, args in calls
+        ]
+        output = subprocess.check_output([NODE, '-e', SCRIPT, ROOT],
+                input=json.dumps(data).encode('utf-8'))
+        return json.loads(output.decode('utf-8'))
+
+    def test_interpolate_hits_the_knots(self):
+        calls = [(x, (10.0, 'height', TABLE)) for x, _ in TABLE]
+        expected = [10.0 + y for _, y in TABLE]
+        self.assertEqual(self.call('interpolate', calls), expected)
+
+    def test_interpolate_between_and_beyond_the_knots(self):
+        choices = [100.5, 103, 99, 106]
+        calls = [(x, (-10.0, 'height', TABLE)) for x in choices]
+        expected = [-9.75, -6.5, -10.5, -2.0]
+        self.assertEqual(self.call('interpolate', calls), expected)
+
+    def test_add_flips_the_factor_for_negative_values(self):
+        # The compiler flips the factor for negative geometry, so that
+        # both move the same way.
+        calls = [
+            (102, (10.0, 'height', 1.0)),
+            (102, (-10.0, 'height', -1.0)),
+            (102, (0, 'height', 1.0)),
+        ]
+        self.assertEqual(self.call('add', calls), [12.0, -8.0, 0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for publishing compiled models as static assets."""
+
+import gzip
+import json
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+
+HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+from opendesk_on_demand import publish
+
+OBJ_JSON = u'''{
+  "data": [],
+  "meta": {
+    "format": "stl",
+    "version_id": "bbbbbbbbbbbb"
+  }
+}'''
+
+class TestPublish(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.tmp_dir, 'output')
+        self.publish_dir = os.path.join(self.output_dir, '.publish')
+        self.model_dir = os.path.join(self.output_dir, 'box')
+        os.makedirs(self.model_dir)
+        self.write(u'obj.json', OBJ_JSON)
+        self.write(u'config.json', u'{"parameters": {}}')
+        self.write(u'delta-aaaaaaaaaaaa-bbbbbbbbbbbb.json', u'{"to": 1}')
+        self.write(u'delta-cccccccccccc-aaaaaaaaaaaa.json', u'{"to": 2}')
+        self.write(u'delta-bad.json', u'{}')
+        # Not a model, as it has no config.
+        os.makedirs(os.path.join(self.output_dir, 'partial'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, filename, text):
+        with open(os.path.join(self.model_dir, filename), 'w') as f:
+            f.write(text)
+
+    def read(self, path, compressed=False):
+        filepath = os.path.join(self.publish_dir, path)
+        if compressed:
+            with gzip.open(filepath, 'rt') as f:
+                return f.read()
+        with open(filepath, 'r') as f:
+            return f.read()
+
+    def test_catalogue_lists_the_hashed_files(self):
+        catalogue = publish.publish(self.output_dir, self.publish_dir)
+        self.assertEqual(list(catalogue['models']), [u'box'])
+        model = catalogue['models'][u'box']
+        self.assertEqual(model['version'], u'bbbbbbbbbbbb')
+        for key, filename in ((u'obj', u'obj.json'),
+                (u'config', u'config.json')):
+            value = model[key]
+            pattern = r'^box/{0}\.\w{{12}}\.json$'.format(key)
+            self.assertRegex(value['path'], pattern)
+            self.assertEqual(value['gz_path'], value['path'] + u'.gz')
+            with open(os.path.join(self.model_dir, filename), 'r') as f:
+                text = f.read()
+            self.assertEqual(value['size'], len(text))
+            self.assertEqual(self.read(value['path']), text)
+            self.assertEqual(self.read(value['gz_path'], True), text)
+        with open(os.path.join(self.publish_dir, 'catalogue.json')) as f:
+            self.assertEqual(json.loads(f.read()), catalogue)
+
+    def test_catalogue_lists_the_deltas_by_version(self):
+        catalogue = publish.publish(self.output_dir, self.publish_dir)
+        deltas = catalogue['models'][u'box']['deltas']
+        self.assertEqual(sorted(deltas), [u'aaaaaaaaaaaa', u'cccccccccccc'])
+        self.assertEqual(deltas[u'aaaaaaaaaaaa']['to'], u'bbbbbbbbbbbb')
+        self.assertEqual(deltas[u'cccccccccccc']['to'], u'aaaaaaaaaaaa')
+        value = deltas[u'cccccccccccc']
+        self.assertTrue(value['path'].startswith(
+                u'box/delta-cccccccccccc-aaaaaaaaaaaa.'))
+        self.assertEqual(self.read(value['gz_path'], True), u'{"to": 2}')
+
+    def test_skips_published_files(self):
+        catalogue = publish.publish(self.output_dir, self.publish_dir)
+        model = catalogue['models'][u'box']
+        source_filepath = os.path.join(self.model_dir, 'obj.json')
+        target_dir = os.path.join(self.publish_dir, 'box')
+        filename, size, written = publish.publish_file(source_filepath,
+                target_dir)
+        self.assertEqual(u'box/' + filename, model['obj']['path'])
+        self.assertEqual(size, len(OBJ_JSON))
+        self.assertEqual(written, 0)
+        # Existing files are left alone, even if they differ.
+        with open(os.path.join(self.publish_dir, model['obj']['path']),
+                'w') as f:
+            f.write(u'existing')
+        publish.publish(self.output_dir, self.publish_dir)
+        self.assertEqual(self.read(model['obj']['path']), u'existing')
+
+if __name__ == '__main__':
+    unittest.main()
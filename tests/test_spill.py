@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the disk backed lists the compiler keeps its data in."""
+
+import os.path
+import sys
+import unittest
+
+HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+from opendesk_on_demand import spill
+
+class TestParseSize(unittest.TestCase):
+    def test_parses_units(self):
+        self.assertEqual(spill.parse_size(u'512'), 512)
+        self.assertEqual(spill.parse_size(u'2k'), 2048)
+        self.assertEqual(spill.parse_size(u'1.5MB'), 1536 * 1024)
+        self.assertEqual(spill.parse_size(u'1G'), 1024 ** 3)
+
+    def test_rejects_less_than_a_byte(self):
+        for value in (u'0', u'-1', u'0M', u'-2G', u'0.0001K'):
+            with self.assertRaises(ValueError):
+                spill.parse_size(value)
+
+class TestSpillList(unittest.TestCase):
+    def setUp(self):
+        self.has_pread = spill.HAS_PREAD
+
+    def tearDown(self):
+        spill.HAS_PREAD = self.has_pread
+
+    def check_round_trip(self):
+        budget = spill.Budget(256)
+        items = spill.SpillList(budget)
+        expected = []
+        for i in range(100):
+            item = u'é{0}'.format(i) * (i % 7)
+            items.append(item)
+            expected.append(item)
+            # Reads between the writes mustn't move where we append.
+            self.assertEqual(items[i], item)
+            self.assertEqual(items[i // 2], expected[i // 2])
+        self.assertIsNotNone(items.file)
+        self.assertEqual(len(items), 100)
+        self.assertEqual(list(items), expected)
+        self.assertEqual(items[-3:], expected[-3:])
+        self.assertEqual(budget.used, 0)
+        items.close()
+
+    def test_round_trips_through_the_spill_file(self):
+        self.check_round_trip()
+
+    def test_round_trips_without_pread(self):
+        spill.HAS_PREAD = False
+        self.check_round_trip()
+
+    def test_holds_nothing_once_spilled(self):
+        budget = spill.Budget(1024)
+        items = spill.SpillList(budget)
+        for i in range(10000):
+            items.append(u'x')
+        self.assertEqual(budget.used, 0)
+        self.assertEqual(items.items, [])
+        self.assertEqual(len(items), 10000)
+        items.close()
+
+    def test_close_releases_the_budget(self):
+        budget = spill.Budget(1024)
+        items = spill.SpillList(budget)
+        items.append(u'a')
+        self.assertGreater(budget.used, 0)
+        items.close()
+        self.assertEqual(budget.used, 0)
+
+if __name__ == '__main__':
+    unittest.main()